@@ -1,9 +1,17 @@
 # app.py
+import asyncio
+import hashlib
+import importlib.util
 import os
+import re
+import time
 import streamlit as st
+import numpy as np
+import orjson
 import pandas as pd
-import requests
-import time
+import pyarrow as pa
+import httpx
+from aiolimiter import AsyncLimiter
 from io import BytesIO
 
 st.set_page_config(page_title="artyrugs Ratings & Reviews", layout="wide")
@@ -13,6 +21,11 @@ st.set_page_config(page_title="artyrugs Ratings & Reviews", layout="wide")
 API_KEY = st.secrets.get("RAINFOREST_API_KEY") or os.environ.get("RAINFOREST_API_KEY")
 MARKETPLACE = "amazon.pl"
 
+# Feature flags (Streamlit secrets): Design/Size overrides from the mapping
+# file, and the aggregated summary / grand total row
+USE_MAPPING = st.secrets.get("USE_MAPPING", True)
+SHOW_TOTALS = st.secrets.get("SHOW_TOTALS", True)
+
 # Optional simple password protection (set APP_PASSWORD in Streamlit secrets)
 APP_PASSWORD = st.secrets.get("APP_PASSWORD")  # optional
 
@@ -27,241 +40,471 @@ st.write("Click **Fetch Reviews** to pull ratings & breakdown from Amazon.")
 # Small UI for ASIN input (you can paste full list or keep repo-managed list)
 asins_text = st.text_area("ASINs (one per line)", height=150,
                          value="B0D7J69H1L\nB0D7J7MV6G \nB0D7J71G7J")  # ASINs
-ASINS = [a.strip() for a in asins_text.splitlines() if a.strip()]
+# re-split the list only when the text actually changes, not on every rerun
+asins_sig = hashlib.md5(asins_text.encode()).hexdigest()
+if st.session_state.get("asins_sig") != asins_sig:
+    raw = [a.strip().upper() for a in asins_text.splitlines() if a.strip()]
+    # drop repeated ASINs (keeping first occurrence) so each is only billed once
+    st.session_state["asins"] = list(dict.fromkeys(raw))
+    st.session_state["asins_dupes"] = len(raw) - len(st.session_state["asins"])
+    st.session_state["asins_sig"] = asins_sig
+ASINS = st.session_state["asins"]
+if st.session_state["asins_dupes"]:
+    st.info(f"Removed {st.session_state['asins_dupes']} duplicate ASIN(s).")
 
-mapping_dict = {}
-mapping_loaded = False
 mapping_path = "ASINs.csv"
-if os.path.exists(mapping_path):
-    try:
-        # try reading with header first
-        map_df = pd.read_csv(mapping_path, dtype=str)
-        # normalize column names
-        map_df.columns = [c.strip() for c in map_df.columns]
-        if "ASIN" not in map_df.columns:
-            # file likely has no header — read without header and assign columns
-            map_df = pd.read_csv(mapping_path, header=None, dtype=str)
-            # assign column names based on available columns
-            if map_df.shape[1] == 1:
-                map_df.columns = ["ASIN"]
-                map_df["Design"] = None
-                map_df["Size"] = None
-            elif map_df.shape[1] == 2:
-                map_df.columns = ["ASIN", "Design"]
-                map_df["Size"] = None
-            else:
-                map_df.columns = ["ASIN", "Design", "Size"] + list(map_df.columns[3:])
-        # ensure required cols exist
-        if "Design" not in map_df.columns:
+
+
+@st.cache_data
+def load_mapping(path, mtime):
+    """Read the ASIN -> Design/Size mapping CSV.
+
+    ``mtime`` is only part of the cache key, so the file is re-parsed
+    once per modification instead of on every rerun.
+    """
+    # try reading with header first
+    map_df = pd.read_csv(path, dtype=str)
+    # normalize column names
+    map_df.columns = [c.strip() for c in map_df.columns]
+    if "ASIN" not in map_df.columns:
+        # file likely has no header — read without header and assign columns
+        map_df = pd.read_csv(path, header=None, dtype=str)
+        # assign column names based on available columns
+        if map_df.shape[1] == 1:
+            map_df.columns = ["ASIN"]
             map_df["Design"] = None
-        if "Size" not in map_df.columns:
             map_df["Size"] = None
-        # normalize ASIN values
-        map_df["ASIN"] = map_df["ASIN"].astype(str).str.strip().str.upper()
-        # build dict: {ASIN: {"Design": val, "Size": val}}
-        mapping_dict = map_df.set_index("ASIN")[["Design", "Size"]].T.to_dict()
+        elif map_df.shape[1] == 2:
+            map_df.columns = ["ASIN", "Design"]
+            map_df["Size"] = None
+        else:
+            map_df.columns = ["ASIN", "Design", "Size"] + list(map_df.columns[3:])
+    # ensure required cols exist
+    if "Design" not in map_df.columns:
+        map_df["Design"] = None
+    if "Size" not in map_df.columns:
+        map_df["Size"] = None
+    # normalize ASIN values
+    map_df["ASIN"] = map_df["ASIN"].astype(str).str.strip().str.upper()
+    # build dict: {ASIN: (design, size)}
+    asin_arr = map_df["ASIN"].to_numpy()
+    design_arr = map_df["Design"].to_numpy()
+    size_arr = map_df["Size"].to_numpy()
+    return {a: (d, s) for a, d, s in zip(asin_arr, design_arr, size_arr)}
+
+
+mapping_dict = {}
+mapping_loaded = False
+if USE_MAPPING and os.path.exists(mapping_path):
+    try:
+        # keep this session's mapping until the file changes on disk
+        mapping_sig = (mapping_path, os.path.getmtime(mapping_path))
+        if st.session_state.get("mapping_sig") != mapping_sig:
+            st.session_state["mapping_dict"] = load_mapping(*mapping_sig)
+            st.session_state["mapping_sig"] = mapping_sig
+        mapping_dict = st.session_state["mapping_dict"]
         mapping_loaded = True
         st.info(f"Loaded mapping from {mapping_path} ({len(mapping_dict)} rows).")
     except Exception as e:
         st.warning(f"Could not read mapping file {mapping_path}: {e}")
 
+# ---- FETCHING ----
+RESULT_COLUMNS = ["ASIN", "Design", "Size", "Average Rating", "Total Reviews",
+                  "5★", "4★", "3★", "2★", "1★"]
+# values for an ASIN without rating data (failed request or no product)
+_NULL_COLS = ("Average Rating", "Total Reviews", "5★", "4★", "3★", "2★", "1★")
+NULL_ROW_TEMPLATE = {k: None for k in _NULL_COLS}
+
+API_URL = "https://api.rainforestapi.com/request"
+MAX_CONNECTIONS = 16
+# cap on in-flight API requests
+API_CONCURRENCY = 10
+# token bucket for the Rainforest rate limit: at most API_RATE requests per second
+API_RATE = 5
+# retry throttled / transient server errors with exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+# minimum seconds between progress bar updates while fetching
+PROGRESS_INTERVAL = 0.1
+# ASINs that returned no product are skipped for a day instead of re-billed
+BAD_ASIN_TTL = 24 * 3600
+
+# specification names that carry size / design (Polish + English listings)
+SIZE_RE = re.compile(r"rozmiar|size", re.IGNORECASE)
+DESIGN_RE = re.compile(r"colour|color|desen", re.IGNORECASE)
+
+
+def null_row(asin, design=None, size=None):
+    """Result row for an ASIN without rating data."""
+    return {"ASIN": asin, "Design": design, "Size": size, **NULL_ROW_TEMPLATE}
+
+
+def parse_product(data, asin):
+    """Turn one API response into a result row.
+
+    The row holds API values only; mapping overrides are applied later.
+    Credit counters (``request_info``) are left out so cached rows never
+    report stale credits.
+    """
+    product = data.get("product", {})
+    # default values
+    design = None
+    size = None
+
+    # first try to extract from API if available
+    if product:
+        for spec in product.get("specifications", []):
+            val = spec.get("value")
+            if val is None:
+                continue
+            name = spec.get("name") or ""
+            if size is None and SIZE_RE.search(name):
+                size = val
+            if design is None and DESIGN_RE.search(name):
+                design = val
+            if size is not None and design is not None:
+                break
+
+    if not product or "rating" not in product:
+        row = null_row(asin, design, size)
+    else:
+        br = product.get("rating_breakdown", {})
+        row = {
+            "ASIN": asin,
+            "Design": design,
+            "Size": size,
+            "Average Rating": product.get("rating"),
+            "Total Reviews": product.get("ratings_total"),
+            "5★": br.get("five_star", {}).get("count", 0),
+            "4★": br.get("four_star", {}).get("count", 0),
+            "3★": br.get("three_star", {}).get("count", 0),
+            "2★": br.get("two_star", {}).get("count", 0),
+            "1★": br.get("one_star", {}).get("count", 0),
+        }
+    return row
+
+
+class CacheMiss(Exception):
+    """Raised by cached_asin() for an ASIN that has not been fetched yet."""
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_asin(asin, marketplace, _data=None):
+    """Parsed API result for one ASIN, cached for an hour.
+
+    Called without ``_data`` to look the ASIN up (raises CacheMiss, which
+    Streamlit does not cache), then with the fetched payload to store it.
+    The leading underscore keeps ``_data`` out of the cache key.
+    """
+    if _data is None:
+        raise CacheMiss(asin)
+    return parse_product(_data, asin)
+
+
+async def fetch(client, slots, limiter, asin):
+    """GET one ASIN from the API and return the decoded JSON payload."""
+    params = {
+        "api_key": API_KEY,
+        "type": "product",
+        "amazon_domain": MARKETPLACE,
+        "asin": asin
+    }
+    for attempt in range(MAX_RETRIES + 1):
+        # limiter only waits when the bucket is empty
+        async with slots, limiter:
+            r = await client.get(API_URL, params=params)
+        if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            break
+        # back off outside the semaphore so other requests can proceed
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+    r.raise_for_status()
+    # decode the raw bytes with orjson; much faster than r.json() on large payloads
+    return orjson.loads(r.content)
+
+
+async def fetch_all(asins, on_done):
+    """Fetch all ASINs concurrently over one HTTP/2 connection.
+
+    Returns one payload per ASIN, in order; failed requests come back as
+    the exception instead of raising. ``on_done`` is called here, outside
+    the request coroutines, so Streamlit's rerun/stop exceptions raised by
+    UI updates propagate instead of being stored as an ASIN's result.
+    """
+    slots = asyncio.Semaphore(API_CONCURRENCY)
+    # shared by all requests, so it enforces a global rate rather than a per-request delay
+    limiter = AsyncLimiter(API_RATE, 1)
+    # transport retries cover connection errors; status retries happen in fetch()
+    transport = httpx.AsyncHTTPTransport(
+        http2=True, retries=3, limits=httpx.Limits(max_connections=MAX_CONNECTIONS))
+    async with httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(30, connect=5)) as client:
+        tasks = [asyncio.ensure_future(fetch(client, slots, limiter, a)) for a in asins]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                try:
+                    await fut
+                except Exception:
+                    pass  # kept on the task and returned below
+                on_done()
+        finally:
+            # no-op for finished tasks; stops the rest if on_done() raised
+            for task in tasks:
+                task.cancel()
+        return [task.exception() if task.exception() is not None else task.result()
+                for task in tasks]
+
+
+class FetchProgress:
+    """Progress bar + caption for a fetch, refreshed at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, total, done=0):
+        self.total = total
+        self.done = done
+        self.bar = st.empty()
+        self.caption = st.empty()
+        self.last_update = time.monotonic()
+
+    def show(self):
+        self.bar.progress(self.done / self.total)
+        self.caption.caption(f"Fetched {self.done}/{self.total}")
+
+    def advance(self):
+        """Count one finished request; used as the on_done callback of fetch_all()."""
+        self.done += 1
+        now = time.monotonic()
+        if now - self.last_update > PROGRESS_INTERVAL or self.done == self.total:
+            self.show()
+            self.last_update = now
+
+
+@st.cache_resource
+def bad_asins():
+    """ASINs that returned no product, shared across sessions: {(asin, marketplace): marked_at}."""
+    return {}
+
+
+def is_known_bad(asin):
+    marked_at = bad_asins().get((asin, MARKETPLACE))
+    return marked_at is not None and time.time() - marked_at < BAD_ASIN_TTL
+
+
+def apply_mapping(row):
+    """Return a copy of ``row`` with Design/Size overridden from the mapping file."""
+    # copy so mapping overrides don't leak into the cached value
+    row = dict(row)
+    map_entry = mapping_dict.get(row["ASIN"])
+    if map_entry:
+        m_design, m_size = map_entry
+        # use mapping value if it's not empty/NaN
+        if pd.notna(m_design) and str(m_design).strip() != "":
+            row["Design"] = m_design
+        if pd.notna(m_size) and str(m_size).strip() != "":
+            row["Size"] = m_size
+    return row
+
+
+# ---- EXPORT ----
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# the multi-sheet report needs xlsxwriter; otherwise fall back to a single sheet
+HAS_XLSXWRITER = importlib.util.find_spec("xlsxwriter") is not None
+
+
+def read_details(details_parquet, totals_parquet=None):
+    """Deserialize the per-ASIN frame and add the grand total row (if any) in place."""
+    details_df = pd.read_parquet(BytesIO(details_parquet))
+    if totals_parquet is not None:
+        totals_df = pd.read_parquet(BytesIO(totals_parquet))
+        details_df.loc[len(details_df)] = totals_df.iloc[0]
+    return details_df
+
+
+@st.cache_data(show_spinner=False)
+def build_report_xlsx(details_parquet, totals_parquet, summary_parquet):
+    """Return the Details + Summary workbook as xlsx bytes.
+
+    Takes the frames serialized to parquet so the bytes themselves are
+    the cache key.
+    """
+    details_df = read_details(details_parquet, totals_parquet)
+    summary_df = pd.read_parquet(BytesIO(summary_parquet))
+    out = BytesIO()
+    # no constant_memory: to_excel writes column by column, and that mode
+    # drops every cell not in the row currently being written
+    engine_kwargs = {"options": {"strings_to_urls": False}}
+    with pd.ExcelWriter(out, engine="xlsxwriter", engine_kwargs=engine_kwargs) as writer:
+        # Details sheet (with grand total row)
+        details_df.to_excel(writer, index=False, sheet_name="Details")
+        # Summary sheet
+        summary_df.to_excel(writer, index=False, sheet_name="Summary")
+    return out.getvalue()
+
+
+@st.cache_data(show_spinner=False)
+def build_single_sheet_xlsx(details_parquet, totals_parquet=None):
+    """Fallback: Details only, written with pandas' default Excel engine."""
+    out = BytesIO()
+    read_details(details_parquet, totals_parquet).to_excel(out, index=False)
+    return out.getvalue()
+
+
+force_refresh = st.checkbox("Force refresh (ignore cached API responses)")
+retry_bad = st.checkbox("Retry known-bad ASINs")
+
 if st.button("Fetch Reviews"):
     if not API_KEY:
         st.error("API key not found. Please configure RAINFOREST_API_KEY in Streamlit Secrets.")
     elif not ASINS:
         st.warning("Please enter at least one ASIN.")
     else:
-        progress = st.progress(0)
-        results = []
+        if force_refresh:
+            cached_asin.clear()
+        if retry_bad:
+            registry = bad_asins()
+            # their no-product responses are still in the API cache; drop
+            # those entries too, or the retry never reaches the API
+            for asin, marketplace in list(registry):
+                cached_asin.clear(asin, marketplace)
+            registry.clear()
         total = len(ASINS)
+        # one pre-allocated list per column; each result is stored in its input slot
+        cols = {c: [None] * total for c in RESULT_COLUMNS}
         credits_used = 0
         credits_remaining = None
 
-        for i, asin in enumerate(ASINS, start=1):
-            with st.spinner(f"Fetching {asin} ({i}/{total})"):
-                url = "https://api.rainforestapi.com/request"
-                params = {
-                    "api_key": API_KEY,
-                    "type": "product",
-                    "amazon_domain": MARKETPLACE,
-                    "asin": asin
-                }
+        # cached results first; everything else goes to the API in one batch
+        fetched = [None] * total
+        misses = []
+        for i, asin in enumerate(ASINS):
+            if is_known_bad(asin):
+                fetched[i] = null_row(asin)
+                continue
+            try:
+                fetched[i] = cached_asin(asin, MARKETPLACE)
+            except CacheMiss:
+                misses.append(i)
+
+        progress = FetchProgress(total, done=total - len(misses))
+        progress.show()
+        if misses:
+            payloads = asyncio.run(fetch_all([ASINS[i] for i in misses], progress.advance))
+            for i, data in zip(misses, payloads):
+                if isinstance(data, Exception):
+                    fetched[i] = data
+                    continue
                 try:
-                    r = requests.get(url, params=params, timeout=30)
-                    data = r.json()
-                    # show credits info on first request (if available)
+                    # credits only come from responses fetched in this run
                     info = data.get("request_info", {})
                     credits_used = info.get("credits_used", credits_used)
                     credits_remaining = info.get("credits_remaining", credits_remaining)
-
-                    product = data.get("product", {})
-                    # default values
-                    design = None
-                    size = None
-
-                    # first try to extract from API if available
-                    if product:
-                        for spec in product.get("specifications", []):
-                            name = spec.get("name", "").lower()
-                            val = spec.get("value")
-                            if val is None:
-                                continue
-                            if "rozmiar" in name or "size" in name:
-                                if not size:
-                                    size = val
-                            if "colour" in name or "color" in name or "dedesignsen" in name:
-                                if not design:
-                                    design = val
-
-                    # if mapping loaded and ASIN matches, override design/size with mapping values
-                    map_entry = mapping_dict.get(asin.strip().upper())
-                    if map_entry:
-                        # map_entry contains {"Design": ..., "Size": ...}
-                        m_design = map_entry.get("Design")
-                        m_size = map_entry.get("Size")
-                        # use mapping value if it's not empty/NaN
-                        if pd.notna(m_design) and str(m_design).strip() != "":
-                            design = m_design
-                        if pd.notna(m_size) and str(m_size).strip() != "":
-                            size = m_size
-
-                    if not product or "rating" not in product:
-                        results.append({
-                            "ASIN": asin, "Design": design, "Size": size,
-                            "Average Rating": None, "Total Reviews": None,
-                            "5★": None, "4★": None, "3★": None, "2★": None, "1★": None,
-                        })
-                    else:
-                        br = product.get("rating_breakdown", {})
-                        results.append({
-                            "ASIN": asin,
-                            "Design": design,
-                            "Size": size,
-                            "Average Rating": product.get("rating"),
-                            "Total Reviews": product.get("ratings_total"),
-                            "5★": br.get("five_star", {}).get("count", 0),
-                            "4★": br.get("four_star", {}).get("count", 0),
-                            "3★": br.get("three_star", {}).get("count", 0),
-                            "2★": br.get("two_star", {}).get("count", 0),
-                            "1★": br.get("one_star", {}).get("count", 0),
-                        })
+                    if not data.get("product"):
+                        bad_asins()[(ASINS[i], MARKETPLACE)] = time.time()
+                    fetched[i] = cached_asin(ASINS[i], MARKETPLACE, _data=data)
                 except Exception as e:
-                    st.error(f"Error fetching {asin}: {e}")
-                    results.append({
-                        "ASIN": asin, "Design": None, "Size": None,
-                        "Average Rating": None, "Total Reviews": None,
-                        "5★": None, "4★": None, "3★": None, "2★": None, "1★": None,
-                    })
+                    fetched[i] = e
 
-            progress.progress(i / total)
-            time.sleep(0.5)  # keep reasonable pacing
+        for i, result in enumerate(fetched):
+            if isinstance(result, Exception):
+                st.error(f"Error fetching {ASINS[i]}: {result}")
+                row = null_row(ASINS[i])
+            else:
+                row = apply_mapping(result)
+            for c in RESULT_COLUMNS:
+                cols[c][i] = row[c]
 
         # --- START: aggregation, totals row, summary and Excel export ---
-        df = pd.DataFrame(results)
+        # star columns are built straight into nullable Int64, so missing counts stay <NA>
+        star_cols = ["5★", "4★", "3★", "2★", "1★"]
+        for col in star_cols:
+            cols[col] = pd.Series(cols[col], dtype="Int64")
+        df = pd.DataFrame(cols)
 
         # Ensure numeric types where appropriate
         df['Average Rating'] = pd.to_numeric(df.get('Average Rating'), errors='coerce')
         df['Total Reviews'] = pd.to_numeric(df.get('Total Reviews'), errors='coerce')
 
-        # Ensure star columns exist and numeric
-        star_cols = ["5★", "4★", "3★", "2★", "1★"]
-        for col in star_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-            else:
-                df[col] = 0
-
-        # Aggregations
-        # Unweighted mean (mean of ASIN average ratings)
-        unweighted_mean = None
-        if df['Average Rating'].dropna().size > 0:
-            unweighted_mean = round(df['Average Rating'].dropna().mean(), 3)
-
-        # Weighted mean (by Total Reviews)
-        weighted_mean = None
-        total_reviews_sum = int(df['Total Reviews'].dropna().sum()) if df['Total Reviews'].dropna().size > 0 else 0
-        if total_reviews_sum > 0:
-            weighted_val = (df['Average Rating'].fillna(0) * df['Total Reviews'].fillna(0)).sum()
-            weighted_mean = round(weighted_val / total_reviews_sum, 3)
-
-        # Star totals
-        total_5 = int(df["5★"].sum())
-        total_4 = int(df["4★"].sum())
-        total_3 = int(df["3★"].sum())
-        total_2 = int(df["2★"].sum())
-        total_1 = int(df["1★"].sum())
-
-        # Create totals row (unweighted mean placed under Average Rating as requested)
-        totals_row = {
-            "ASIN": "GRAND TOTAL",
-            "Design": None,
-            "Size": None,
-            "Average Rating": unweighted_mean,
-            "Total Reviews": total_reviews_sum,
-            "5★": total_5,
-            "4★": total_4,
-            "3★": total_3,
-            "2★": total_2,
-            "1★": total_1
-        }
+        if SHOW_TOTALS:
+            # Aggregations
+            ratings = df["Average Rating"].to_numpy(dtype=np.float64)
+            reviews = df["Total Reviews"].to_numpy(dtype=np.float64)
+
+            # Unweighted mean (mean of ASIN average ratings)
+            unweighted_mean = round(float(np.nanmean(ratings)), 3) if np.isfinite(ratings).any() else None
+
+            # Weighted mean (by Total Reviews), only over ASINs that have both values
+            total_reviews_sum = int(np.nansum(reviews))
+            mask = np.isfinite(ratings) & np.isfinite(reviews) & (reviews > 0)
+            weighted_mean = None
+            if mask.any():
+                weighted_mean = round(float(np.average(ratings[mask], weights=reviews[mask])), 3)
+
+            # Star totals (one reduction over the (N, 5) star matrix, missing counts as 0)
+            stars_mat = df[star_cols].to_numpy(dtype=np.int64, na_value=0)
+            total_5, total_4, total_3, total_2, total_1 = stars_mat.sum(axis=0).tolist()
+
+            # Create totals row (unweighted mean placed under Average Rating as requested)
+            totals_row = {
+                "ASIN": "GRAND TOTAL",
+                "Design": None,
+                "Size": None,
+                "Average Rating": unweighted_mean,
+                "Total Reviews": total_reviews_sum,
+                "5★": total_5,
+                "4★": total_4,
+                "3★": total_3,
+                "2★": total_2,
+                "1★": total_1
+            }
 
-        # Ensure all keys exist in df columns
-        for k in totals_row.keys():
-            if k not in df.columns:
-                df[k] = None
-
-        # Append totals row
-        df_with_totals = pd.concat([df, pd.DataFrame([totals_row])], ignore_index=True)
-
-        # Streamlit summary display
-        st.markdown("### Summary")
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Unweighted avg (mean of ASIN averages)", unweighted_mean if unweighted_mean is not None else "N/A")
-        c2.metric("Weighted avg (by total reviews)", weighted_mean if weighted_mean is not None else "N/A")
-        c3.metric("Total reviews (sum)", total_reviews_sum)
-
-        # Star breakdown table + chart
-        star_df = pd.DataFrame({
-            "Stars": ["5★", "4★", "3★", "2★", "1★"],
-            "Count": [total_5, total_4, total_3, total_2, total_1]
-        })
-        st.write("**Star counts (sum across ASINs):**")
-        st.table(star_df)
-        st.bar_chart(star_df.set_index("Stars"))
-
-        # Show full results with totals row
+            # Totals row is kept separate so df stays per-ASIN only; it is shown as
+            # a footer below the results and appended to the Excel Details sheet
+            totals_df = pd.DataFrame([totals_row], columns=df.columns)
+
+            # Streamlit summary display
+            st.markdown("### Summary")
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Unweighted avg (mean of ASIN averages)", unweighted_mean if unweighted_mean is not None else "N/A")
+            c2.metric("Weighted avg (by total reviews)", weighted_mean if weighted_mean is not None else "N/A")
+            c3.metric("Total reviews (sum)", total_reviews_sum)
+
+            # Star breakdown table + chart
+            star_df = pd.DataFrame({
+                "Stars": ["5★", "4★", "3★", "2★", "1★"],
+                "Count": [total_5, total_4, total_3, total_2, total_1]
+            })
+            st.write("**Star counts (sum across ASINs):**")
+            st.table(star_df)
+            st.bar_chart(star_df.set_index("Stars"))
+
+        # Show full results (with totals row as a footer)
         st.subheader("Results")
-        st.dataframe(df_with_totals)
+        # send an Arrow table with 32-bit star counts to shrink the websocket payload
+        results_tbl = pa.Table.from_pandas(df.astype({c: "Int32" for c in star_cols}), preserve_index=False)
+        st.dataframe(results_tbl, width="stretch", hide_index=True)
+        if SHOW_TOTALS:
+            st.dataframe(totals_df, width="stretch", hide_index=True)
 
-        # Prepare Excel with Details + Summary sheets
-        out = BytesIO()
-        try:
-            with pd.ExcelWriter(out, engine="openpyxl") as writer:
-                # Details sheet (with grand total row)
-                df_with_totals.to_excel(writer, index=False, sheet_name="Details")
-                # Summary sheet
-                summary_dict = {
-                    "Metric": ["Unweighted mean", "Weighted mean", "Total reviews sum", "Total 5★", "Total 4★", "Total 3★", "Total 2★", "Total 1★"],
-                    "Value": [unweighted_mean, weighted_mean, total_reviews_sum, total_5, total_4, total_3, total_2, total_1]
-                }
-                pd.DataFrame(summary_dict).to_excel(writer, index=False, sheet_name="Summary")
-                
-            out.seek(0)
-            st.download_button("⬇️ Download artyrugs Ratings&Reviews Report", data=out.getvalue(),
+        # workbooks are built only when the download button is clicked
+        if not SHOW_TOTALS:
+            st.download_button("⬇️ Download artyrugs Ratings&Reviews Report",
+                               data=lambda: build_single_sheet_xlsx(df.to_parquet()),
+                               file_name="artyrugs_Ratings&Reviews.xlsx",
+                               mime=XLSX_MIME)
+        elif HAS_XLSXWRITER:
+            # Prepare Excel with Details + Summary sheets
+            summary_df = pd.DataFrame({
+                "Metric": ["Unweighted mean", "Weighted mean", "Total reviews sum", "Total 5★", "Total 4★", "Total 3★", "Total 2★", "Total 1★"],
+                "Value": [unweighted_mean, weighted_mean, total_reviews_sum, total_5, total_4, total_3, total_2, total_1]
+            })
+            st.download_button("⬇️ Download artyrugs Ratings&Reviews Report",
+                               data=lambda: build_report_xlsx(df.to_parquet(), totals_df.to_parquet(), summary_df.to_parquet()),
                                file_name="artyrugs_ratings&reviews.xlsx",
-                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        except Exception as e:
-            st.error("Could not create multi-sheet Excel. Please ensure 'openpyxl' is installed.")
-            out2 = BytesIO()
-            df_with_totals.to_excel(out2, index=False)
-            out2.seek(0)
-            st.download_button("⬇️ Download artyrugs Ratings&Reviews Report", data=out2.getvalue(),
-                       file_name="artyrugs_Ratings&Reviews.xlsx",
-                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            # fallback: simple single-sheet excel if openpyxl not available
-            out2 = BytesIO()
-            df_with_totals.to_excel(out2, index=False)
-            out2.seek(0)
+                               mime=XLSX_MIME)
+        else:
+            st.error("Could not create multi-sheet Excel. Please ensure 'xlsxwriter' is installed.")
+            st.download_button("⬇️ Download artyrugs Ratings&Reviews Report",
+                               data=lambda: build_single_sheet_xlsx(df.to_parquet(), totals_df.to_parquet()),
+                               file_name="artyrugs_Ratings&Reviews.xlsx",
+                               mime=XLSX_MIME)
         # --- END: aggregation, totals row, summary and Excel export ---
 
         # show credits info if available